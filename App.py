@@ -4,14 +4,44 @@ A simple file sharing application to share files between devices on the same WiF
 """
 
 import os
+import io
+import math
+import sys
 import socket
-from flask import Flask, render_template_string, request, send_file, redirect, url_for
+import asyncio
+import argparse
+import hashlib
+import mmap
+import mimetypes
+import stat
+import random
+import threading
+import time
+import queue
+import uuid
+import shutil
+import zipfile
+import cProfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from email.utils import formatdate
+from urllib.parse import urlencode, unquote, unquote_to_bytes
+from flask import Flask, Request, render_template_string, request, send_file, redirect, url_for, g, jsonify
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.http import is_resource_modified, parse_options_header, parse_range_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
 from datetime import datetime
 
 # Initialize Flask app
 app = Flask(__name__)
 
+
+class UploadRejected(Exception):
+    """Raised while an upload is still streaming in, to stop receiving it"""
+
 # Configuration
 UPLOAD_FOLDER = 'shared_files'
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500 MB
@@ -24,6 +54,96 @@ if not os.path.exists(UPLOAD_FOLDER):
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+# Storage layout: 'flat' keeps every file directly in UPLOAD_FOLDER, 'sharded'
+# spreads them over hash-prefixed subfolders (e.g. shared_files/3f/a2/report.pdf)
+# so huge collections don't slow down directory operations. URLs are the same
+# either way; switch existing folders with: python app.py --migrate-storage sharded
+STORAGE_LAYOUT = 'flat'
+SHARD_LEVELS = 2  # Do not change once files have been stored sharded
+SHARD_WIDTH = 2  # Hex characters per shard folder name
+
+app.config['STORAGE_LAYOUT'] = STORAGE_LAYOUT
+
+# Request profiling (off by default, can be changed at runtime via app.config)
+PROFILE_SAMPLE_RATE = 0.0  # Fraction of requests to profile (0.0 - 1.0)
+PROFILE_ADMIN_TOKEN = ''  # Requests sending this in the X-Profile header are always profiled
+PROFILE_DIR = 'profiles'
+PROFILE_MAX_FILES = 200  # Oldest dumps are removed beyond this count
+
+app.config['PROFILE_SAMPLE_RATE'] = PROFILE_SAMPLE_RATE
+app.config['PROFILE_ADMIN_TOKEN'] = PROFILE_ADMIN_TOKEN
+app.config['PROFILE_DIR'] = PROFILE_DIR
+app.config['PROFILE_MAX_FILES'] = PROFILE_MAX_FILES
+
+# Check uploaded content against its extension while it streams in
+VALIDATE_CONTENT = True
+SNIFF_SIZE = 4096  # Bytes collected before running a content validator
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, '.incoming')  # Same disk, so finished uploads are renamed, not copied
+
+app.config['VALIDATE_CONTENT'] = VALIDATE_CONTENT
+
+# Set once spools left behind by a previous run have been removed
+_incoming_swept = False
+_incoming_lock = threading.Lock()
+
+# Content validators by extension, see content_validator()
+CONTENT_VALIDATORS = {}
+
+# Only one cProfile profiler can be active per process on recent Pythons
+_profile_lock = threading.Lock()
+
+# Server-side zip extraction (off by default)
+EXTRACT_ON_UPLOAD = False  # Allow uploads to ask for their zip to be unpacked
+EXTRACT_WORKERS = 4  # Processes decompressing members in parallel
+EXTRACT_MAX_MEMBERS = 10000
+EXTRACT_MAX_TOTAL_SIZE = 4 * MAX_FILE_SIZE  # Uncompressed bytes per archive
+EXTRACT_MAX_RATIO = 100  # Max compression ratio per member (zip bomb guard)
+
+app.config['EXTRACT_ON_UPLOAD'] = EXTRACT_ON_UPLOAD
+app.config['EXTRACT_WORKERS'] = EXTRACT_WORKERS
+app.config['EXTRACT_MAX_MEMBERS'] = EXTRACT_MAX_MEMBERS
+app.config['EXTRACT_MAX_TOTAL_SIZE'] = EXTRACT_MAX_TOTAL_SIZE
+app.config['EXTRACT_MAX_RATIO'] = EXTRACT_MAX_RATIO
+
+# Extraction jobs by id, shared between request threads and job threads
+extract_jobs = {}
+_extract_lock = threading.Lock()
+_extract_pool = None
+MAX_EXTRACT_JOBS = 100  # Finished jobs are forgotten beyond this count
+
+# Hot-file download cache
+FILE_CACHE_SIZE = 256 * 1024 * 1024  # Max bytes of small files held in memory
+FILE_CACHE_MAX_ITEM_SIZE = 8 * 1024 * 1024  # Larger files are mmapped instead of read
+FILE_CACHE_MAX_ENTRIES = 256  # Max cached files, in memory and mmapped together
+# An open mapping stops Windows from deleting or renaming the file, so large
+# files are streamed from disk there instead of being kept mmapped
+FILE_CACHE_USE_MMAP = os.name != 'nt'
+
+app.config['FILE_CACHE_SIZE'] = FILE_CACHE_SIZE
+app.config['FILE_CACHE_MAX_ITEM_SIZE'] = FILE_CACHE_MAX_ITEM_SIZE
+app.config['FILE_CACHE_MAX_ENTRIES'] = FILE_CACHE_MAX_ENTRIES
+
+# Cached files by path, least recently used first
+_file_cache = OrderedDict()
+_file_cache_loading = {}  # Path -> Event, so concurrent misses load a file only once
+_file_cache_lock = threading.Lock()
+file_cache_stats = {'hits': 0, 'misses': 0, 'memory_bytes': 0}
+
+# Asyncio transfer server (python app.py --async)
+ASYNC_IO_WORKERS = 4  # Threads doing disk reads and writes for every transfer
+ASYNC_WSGI_WORKERS = 8  # Threads running the Flask app for all other pages
+ASYNC_IDLE_TIMEOUT = 60  # Seconds to wait for a slow client before dropping it
+ASYNC_CHUNK_SIZE = 64 * 1024  # Bytes read from or written to a socket at a time
+ASYNC_MAX_FORM_SIZE = 1024 * 1024  # Request bodies for non-upload routes
+
+# Deleted files are moved here at once and unlinked in the background
+TRASH_FOLDER = os.path.join(UPLOAD_FOLDER, '.trash')
+DELETE_WORKERS = 2  # Max concurrent unlinks
+
+trash_queue = queue.Queue()
+_trash_workers = []
+_trash_lock = threading.Lock()
+
 # HTML Template
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -349,6 +469,9 @@ HTML_TEMPLATE = """
                     </label>
                     <input type="file" id="file" name="file" required>
                 </div>
+                {% if extract_enabled %}
+                    <label class="file-meta"><input type="checkbox" name="extract" value="1"> Extract zip files on the server</label>
+                {% endif %}
                 <button type="submit" class="upload-btn">🚀 Upload File</button>
             </form>
         </div>
@@ -429,6 +552,231 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def content_validator(*extensions):
+    """Register a function that checks the first bytes of files with these extensions
+    
+    The function gets up to SNIFF_SIZE bytes from the start of the file and
+    returns True if they look like that file type.
+    """
+    def register(func):
+        for extension in extensions:
+            CONTENT_VALIDATORS[extension] = func
+        return func
+    return register
+
+
+@content_validator('txt', 'csv')
+def is_text(head):
+    """Text files must not contain NUL bytes (unless UTF-16 with a BOM)"""
+    return head.startswith((b'\xff\xfe', b'\xfe\xff')) or b'\x00' not in head
+
+
+@content_validator('pdf')
+def is_pdf(head):
+    return head.startswith(b'%PDF-')
+
+
+@content_validator('png')
+def is_png(head):
+    return head.startswith(b'\x89PNG\r\n\x1a\n')
+
+
+@content_validator('jpg', 'jpeg')
+def is_jpeg(head):
+    return head.startswith(b'\xff\xd8\xff')
+
+
+@content_validator('gif')
+def is_gif(head):
+    return head.startswith((b'GIF87a', b'GIF89a'))
+
+
+@content_validator('mp4')
+def is_mp4(head):
+    # ISO media files start with a box whose type is 'ftyp'
+    return head[4:8] == b'ftyp'
+
+
+@content_validator('mp3')
+def is_mp3(head):
+    # Either an ID3 tag or an MPEG audio frame sync
+    return head.startswith(b'ID3') or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0)
+
+
+@content_validator('zip', 'docx', 'xlsx', 'pptx', 'apk')
+def is_zip(head):
+    # Local file header, or the end record of an empty archive
+    return head.startswith((b'PK\x03\x04', b'PK\x05\x06'))
+
+
+@content_validator('rar')
+def is_rar(head):
+    return head.startswith(b'Rar!\x1a\x07')
+
+
+@content_validator('doc', 'xls')
+def is_ole(head):
+    return head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')
+
+
+@content_validator('exe')
+def is_exe(head):
+    return head.startswith(b'MZ')
+
+
+def get_content_validator(filename):
+    """Get the content validator for a file name
+    
+    Raises UploadRejected if the extension isn't allowed at all. Returns None
+    for allowed extensions that have no validator.
+    """
+    if not allowed_file(filename):
+        raise UploadRejected('File type not allowed')
+    return CONTENT_VALIDATORS.get(filename.rsplit('.', 1)[1].lower())
+
+
+def move_exclusive(src, dst):
+    """Move a file to dst, raising FileExistsError instead of replacing it"""
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except (OSError, NotImplementedError):
+        # No hard links on this filesystem (e.g. FAT): reserve the name, then move over it
+        os.close(os.open(dst, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        try:
+            os.replace(src, dst)
+        except OSError:
+            os.remove(dst)
+            raise
+    else:
+        os.remove(src)
+
+
+def sweep_incoming_folder():
+    """Remove spools left in INCOMING_FOLDER by a crash, once per process"""
+    global _incoming_swept
+    with _incoming_lock:
+        if _incoming_swept:
+            return
+        _incoming_swept = True
+        if not os.path.exists(INCOMING_FOLDER):
+            return
+        
+        for name in os.listdir(INCOMING_FOLDER):
+            try:
+                os.remove(os.path.join(INCOMING_FOLDER, name))
+            except OSError:
+                pass
+
+
+class SniffingFile:
+    """Upload spool that validates content as the first chunks arrive
+    
+    Werkzeug writes the multipart body for a file straight into this object.
+    Once SNIFF_SIZE bytes are in (or the part ends), the validator for the
+    file's extension runs; a mismatch raises UploadRejected, which stops
+    reading the rest of the request body. Accepted files are written to
+    INCOMING_FOLDER once and later moved into place with commit().
+    """
+    
+    def __init__(self, filename, validate=True):
+        self.filename = filename
+        self.validator = get_content_validator(filename) if validate else None
+        self.head = b''
+        self.checked = self.validator is None
+        
+        sweep_incoming_folder()
+        os.makedirs(INCOMING_FOLDER, exist_ok=True)
+        # Not mkstemp: its 0600 mode would stick to the committed file, so let the umask apply
+        self.path = os.path.join(INCOMING_FOLDER, uuid.uuid4().hex)
+        fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_RDWR | getattr(os, 'O_BINARY', 0), 0o666)
+        self.file = os.fdopen(fd, 'w+b')
+    
+    def check(self):
+        """Run the validator on the collected head of the file"""
+        self.checked = True
+        if not self.validator(self.head):
+            self.close()
+            raise UploadRejected(f'File content does not match its .{self.filename.rsplit(".", 1)[1]} extension')
+    
+    def write(self, data):
+        if not self.checked:
+            self.head += data[:SNIFF_SIZE - len(self.head)]
+            if len(self.head) >= SNIFF_SIZE:
+                self.check()
+        return self.file.write(data)
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Werkzeug seeks back to the start once the whole part is written
+        if not self.checked:
+            self.check()
+        return self.file.seek(offset, whence)
+    
+    def read(self, size=-1):
+        return self.file.read(size)
+    
+    def tell(self):
+        return self.file.tell()
+    
+    def commit(self, filepath):
+        """Move the received file into place without copying it
+        
+        Raises FileExistsError, keeping the spool, if filepath is taken.
+        """
+        self.file.close()
+        move_exclusive(self.path, filepath)
+        self.path = None
+    
+    def close(self):
+        """Close the spool, discarding it unless it was committed"""
+        self.file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+
+class UploadRequest(Request):
+    """Request that spools uploaded files through a SniffingFile
+    
+    Every spool is tracked and closed when the request ends, or as soon as
+    parsing fails, so rejected or cut-short uploads leave nothing behind.
+    Committed spools are unaffected by closing.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spools = []
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and app.config['VALIDATE_CONTENT']:
+            spool = SniffingFile(filename)
+            self._spools.append(spool)
+            return spool
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+    
+    def _load_form_data(self):
+        try:
+            super()._load_form_data()
+        except BaseException:
+            self.close_spools()
+            raise
+    
+    def close_spools(self):
+        """Close every spool created for this request"""
+        while self._spools:
+            self._spools.pop().close()
+    
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.close_spools()
+
+
+app.request_class = UploadRequest
+
+
 def get_file_size(size_bytes):
     """Convert bytes to human-readable format"""
     for unit in ['B', 'KB', 'MB', 'GB']:
@@ -438,30 +786,598 @@ def get_file_size(size_bytes):
     return f"{size_bytes:.1f} TB"
 
 
+def storage_path(filename, layout=None):
+    """Get the path a file is stored at under a storage layout"""
+    layout = layout or app.config['STORAGE_LAYOUT']
+    if layout == 'sharded':
+        digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+        shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+        return os.path.join(UPLOAD_FOLDER, *shards, filename)
+    return os.path.join(UPLOAD_FOLDER, filename)
+
+
+def find_file(filename):
+    """Get the path of a stored file, or None if it doesn't exist
+    
+    Looks in the other layout too, so files are found while a migration
+    between layouts is still running.
+    """
+    layout = app.config['STORAGE_LAYOUT']
+    other_layout = 'flat' if layout == 'sharded' else 'sharded'
+    for filepath in (storage_path(filename, layout), storage_path(filename, other_layout)):
+        if os.path.isfile(filepath):
+            return filepath
+    return None
+
+
+def iter_stored_files(folder=UPLOAD_FOLDER, depth=0):
+    """Yield a DirEntry for every stored file, in either layout"""
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                # Skip internal folders such as the trash
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_file():
+                    yield entry
+                elif entry.is_dir() and depth < SHARD_LEVELS:
+                    yield from iter_stored_files(entry.path, depth + 1)
+    except FileNotFoundError:
+        return
+
+
+def migrate_storage(layout):
+    """Move every stored file into a layout and return how many were moved
+    
+    Files are moved one rename at a time and find_file checks both layouts,
+    so this is safe to run while the server is handling requests.
+    """
+    moved = 0
+    for entry in list(iter_stored_files()):
+        target = storage_path(entry.name, layout)
+        if entry.path == target:
+            continue
+        if os.path.exists(target):
+            print(f"⚠️  Skipping {entry.path}: {target} already exists")
+            continue
+        
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(entry.path, target)
+        moved += 1
+        
+        # Remove shard folders left empty by a move back to the flat layout
+        folder = os.path.dirname(entry.path)
+        while os.path.abspath(folder) != os.path.abspath(UPLOAD_FOLDER):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+    
+    return moved
+
+
 def get_files_list():
     """Get list of uploaded files with metadata"""
     files = []
-    if os.path.exists(UPLOAD_FOLDER):
-        for filename in os.listdir(UPLOAD_FOLDER):
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                mod_time = os.path.getmtime(filepath)
-                mod_date = datetime.fromtimestamp(mod_time).strftime('%Y-%m-%d %H:%M')
-                
-                files.append({
-                    'name': filename,
-                    'filename': filename,
-                    'size': get_file_size(size),
-                    'date': mod_date
-                })
-        
-        # Sort by modification time (newest first)
-        files.sort(key=lambda x: os.path.getmtime(os.path.join(UPLOAD_FOLDER, x['filename'])), reverse=True)
+    for entry in iter_stored_files():
+        file_stat = entry.stat()
+        mod_date = datetime.fromtimestamp(file_stat.st_mtime).strftime('%Y-%m-%d %H:%M')
+        
+        files.append({
+            'name': entry.name,
+            'filename': entry.name,
+            'size': get_file_size(file_stat.st_size),
+            'date': mod_date,
+            'mtime': file_stat.st_mtime
+        })
+    
+    # Sort by modification time (newest first)
+    files.sort(key=lambda x: x['mtime'], reverse=True)
     
     return files
 
 
+def is_profiling_admin():
+    """Check if the request carries the profiling admin token"""
+    token = app.config.get('PROFILE_ADMIN_TOKEN')
+    return bool(token) and request.headers.get('X-Profile') == token
+
+
+def save_profile(profiler, endpoint):
+    """Write a profiler's stats to the profile folder and rotate old dumps"""
+    profile_dir = app.config['PROFILE_DIR']
+    if not os.path.exists(profile_dir):
+        os.makedirs(profile_dir)
+    
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    profiler.dump_stats(os.path.join(profile_dir, f"{endpoint}-{stamp}.pstats"))
+    
+    # Keep only the newest PROFILE_MAX_FILES dumps
+    dumps = [os.path.join(profile_dir, name) for name in os.listdir(profile_dir) if name.endswith('.pstats')]
+    dumps.sort(key=os.path.getmtime)
+    for old_dump in dumps[:-app.config['PROFILE_MAX_FILES']]:
+        try:
+            os.remove(old_dump)
+        except OSError:
+            pass
+
+
+class CachedFileReader:
+    """Seekable read-only file object over a shared cached buffer
+    
+    Each download gets its own reader, but they all point at the same
+    bytes or mmap, so concurrent downloads never copy the whole file.
+    """
+    
+    def __init__(self, buffer):
+        self.view = memoryview(buffer)
+        self.pos = 0
+    
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(self.pos + size, len(self.view))
+        chunk = self.view[self.pos:end].tobytes()
+        self.pos = end
+        return chunk
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += len(self.view)
+        self.pos = max(0, min(offset, len(self.view)))
+        return self.pos
+    
+    def tell(self):
+        return self.pos
+    
+    def seekable(self):
+        return True
+    
+    def close(self):
+        self.view.release()
+
+
+def file_cache_key(file_stat):
+    """Identify a file version, so replaced files are never served stale"""
+    return (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def disk_entry(filepath, file_stat):
+    """Describe a file that is streamed from disk instead of cached"""
+    return {
+        'key': file_cache_key(file_stat),
+        'buffer': None,
+        'path': filepath,
+        'size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'memory_bytes': 0
+    }
+
+
+def load_cache_entry(filepath):
+    """Read a small file into memory or mmap a large one
+    
+    Returns an entry without a buffer for large files when mmap isn't used.
+    """
+    with open(filepath, 'rb') as f:
+        file_stat = os.fstat(f.fileno())
+        entry = disk_entry(filepath, file_stat)
+        if file_stat.st_size <= app.config['FILE_CACHE_MAX_ITEM_SIZE']:
+            entry['buffer'] = f.read()
+            entry['memory_bytes'] = len(entry['buffer'])
+        elif FILE_CACHE_USE_MMAP:
+            # The mapping stays valid after the file is closed, replaced or deleted
+            entry['buffer'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    return entry
+
+
+def invalidate_cached_file(filepath):
+    """Drop a file from the download cache"""
+    with _file_cache_lock:
+        entry = _file_cache.pop(filepath, None)
+        if entry is not None:
+            file_cache_stats['memory_bytes'] -= entry['memory_bytes']
+
+
+def get_cached_file(filepath):
+    """Get a cache entry for a file, loading it on a miss
+    
+    Returns None if the path is not a regular file. Entries are dropped
+    automatically once the file on disk is replaced or deleted. If the file
+    can't be cached (or loading it fails), the entry has no buffer and the
+    file should be streamed from disk.
+    """
+    while True:
+        try:
+            file_stat = os.stat(filepath)
+        except OSError:
+            invalidate_cached_file(filepath)
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        
+        with _file_cache_lock:
+            entry = _file_cache.get(filepath)
+            if entry is not None and entry['key'] == file_cache_key(file_stat):
+                _file_cache.move_to_end(filepath)
+                file_cache_stats['hits'] += 1
+                return entry
+            
+            loading = _file_cache_loading.get(filepath)
+            if loading is None:
+                file_cache_stats['misses'] += 1
+                loading = _file_cache_loading[filepath] = threading.Event()
+                break
+        
+        # Another request is already loading this file; share its result
+        loading.wait()
+    
+    try:
+        entry = load_cache_entry(filepath)
+    except (OSError, ValueError, MemoryError) as e:
+        # e.g. EMFILE, ENOMEM or a failed mmap: the file is still there, so serve it from disk
+        app.logger.warning(f'Could not cache {filepath}: {e}')
+        entry = disk_entry(filepath, file_stat)
+    
+    with _file_cache_lock:
+        del _file_cache_loading[filepath]
+        old_entry = _file_cache.pop(filepath, None)
+        if old_entry is not None:
+            file_cache_stats['memory_bytes'] -= old_entry['memory_bytes']
+        
+        if entry['buffer'] is not None:
+            _file_cache[filepath] = entry
+            file_cache_stats['memory_bytes'] += entry['memory_bytes']
+            
+            # Evict least recently used files until back under budget
+            while len(_file_cache) > 1 and (
+                    file_cache_stats['memory_bytes'] > app.config['FILE_CACHE_SIZE']
+                    or len(_file_cache) > app.config['FILE_CACHE_MAX_ENTRIES']):
+                _, evicted = _file_cache.popitem(last=False)
+                file_cache_stats['memory_bytes'] -= evicted['memory_bytes']
+    
+    loading.set()
+    return entry
+
+
+def send_cached_file(entry, filename):
+    """Build a download response served from a cache entry"""
+    if entry['buffer'] is None:
+        return send_file(entry['path'], as_attachment=True, download_name=filename)
+    
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    data = wrap_file(request.environ, CachedFileReader(entry['buffer']), buffer_size=64 * 1024)
+    
+    response = app.response_class(data, mimetype=mimetype, direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    response.content_length = entry['size']
+    response.last_modified = entry['mtime']
+    response.cache_control.no_cache = True
+    response.set_etag('-'.join(str(part) for part in entry['key']))
+    return response.make_conditional(request.environ, accept_ranges=True, complete_length=entry['size'])
+
+
+def trash_worker():
+    """Unlink trashed files one at a time (runs in a thread)"""
+    while True:
+        trash_path = trash_queue.get()
+        try:
+            os.remove(trash_path)
+        except OSError as e:
+            app.logger.warning(f'Could not remove {trash_path}: {e}')
+        finally:
+            trash_queue.task_done()
+
+
+def start_trash_workers():
+    """Start the unlink workers and requeue anything left in the trash"""
+    with _trash_lock:
+        if _trash_workers:
+            return
+        if not os.path.exists(TRASH_FOLDER):
+            os.makedirs(TRASH_FOLDER)
+        
+        # Files trashed before a restart still need unlinking
+        for name in os.listdir(TRASH_FOLDER):
+            trash_queue.put(os.path.join(TRASH_FOLDER, name))
+        
+        for _ in range(DELETE_WORKERS):
+            worker = threading.Thread(target=trash_worker, daemon=True)
+            worker.start()
+            _trash_workers.append(worker)
+
+
+def move_to_trash(filepath):
+    """Hide a file immediately and queue it for unlinking
+    
+    Renaming within the upload folder is a cheap metadata update, so the
+    file disappears from listings and frees its name right away even when
+    the unlink itself is slow.
+    """
+    start_trash_workers()
+    trash_path = os.path.join(TRASH_FOLDER, f"{uuid.uuid4().hex}-{os.path.basename(filepath)}")
+    os.rename(filepath, trash_path)
+    invalidate_cached_file(filepath)
+    trash_queue.put(trash_path)
+
+
+def extract_member(archive, name, target, declared_size, validate=False):
+    """Decompress one zip member to target and return the number of bytes written
+    
+    With validate, the member's content is checked against the target's
+    extension first, like an upload, and a mismatch raises ValueError.
+    On any error the partly written target is removed before re-raising.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    created = False
+    size = 0
+    try:
+        with archive.open(name) as source:
+            head = b''
+            if validate:
+                while len(head) < SNIFF_SIZE:
+                    chunk = source.read(SNIFF_SIZE - len(head))
+                    if not chunk:
+                        break
+                    head += chunk
+                filename = os.path.basename(target)
+                validator = get_content_validator(filename)
+                if validator and not validator(head):
+                    raise ValueError(f'content does not match its .{filename.rsplit(".", 1)[1]} extension')
+            
+            # 'xb' refuses to overwrite a file that appeared since planning
+            with open(target, 'xb') as dest:
+                created = True
+                chunk = head or source.read(64 * 1024)
+                while chunk:
+                    size += len(chunk)
+                    # Do not trust the header: stop if the member inflates past it
+                    if size > declared_size:
+                        raise ValueError(f'{name} is larger than its header claims')
+                    dest.write(chunk)
+                    chunk = source.read(64 * 1024)
+    except BaseException:
+        if created and os.path.exists(target):
+            os.remove(target)
+        raise
+    return size
+
+
+def extract_members(zip_path, members, validate=False):
+    """Decompress a batch of zip members (runs in a worker process)
+    
+    members is a list of (member name, target path, declared size) tuples.
+    Returns a (target path, bytes written, error message) tuple per member;
+    error is None for members that are now on disk.
+    """
+    results = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for name, target, declared_size in members:
+            try:
+                results.append((target, extract_member(archive, name, target, declared_size, validate), None))
+            except Exception as e:
+                results.append((target, 0, f'{name}: {e}'))
+    return results
+
+
+def plan_extraction(archive):
+    """Validate a zip and map its members to safe, unique target paths
+    
+    Raises ValueError if the archive looks like a zip bomb.
+    """
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if len(members) > app.config['EXTRACT_MAX_MEMBERS']:
+        raise ValueError(f'Archive has too many files ({len(members)})')
+    
+    total_size = sum(info.file_size for info in members)
+    if total_size > app.config['EXTRACT_MAX_TOTAL_SIZE']:
+        raise ValueError(f'Archive expands to {get_file_size(total_size)}, which is too large')
+    
+    plan = []
+    taken = set()
+    for info in members:
+        if info.file_size / max(info.compress_size, 1) > app.config['EXTRACT_MAX_RATIO']:
+            raise ValueError(f'{info.filename} is compressed suspiciously well')
+        
+        # Flatten the path and sanitize the name so nothing escapes the upload folder
+        filename = secure_filename(os.path.basename(info.filename))
+        if not filename or not allowed_file(filename):
+            continue
+        
+        base, ext = os.path.splitext(filename)
+        counter = 1
+        while filename in taken or find_file(filename):
+            filename = f"{base}_{counter}{ext}"
+            counter += 1
+        taken.add(filename)
+        plan.append((info.filename, storage_path(filename), info.file_size))
+    
+    return plan
+
+
+def get_extract_pool():
+    """Get the shared extraction process pool, creating it on first use"""
+    global _extract_pool
+    with _extract_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=app.config['EXTRACT_WORKERS'])
+        return _extract_pool
+
+
+def discard_extract_pool(pool):
+    """Forget a broken extraction pool so the next job starts a fresh one"""
+    global _extract_pool
+    with _extract_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+    pool.shutdown(wait=False)
+
+
+def update_extract_job(job_id, **fields):
+    """Update an extraction job's status fields"""
+    with _extract_lock:
+        extract_jobs[job_id].update(fields)
+
+
+def extract_zip(job_id, zip_path):
+    """Extract a zip in the process pool, recording progress, and return the errors"""
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            plan = plan_extraction(archive)
+    except (zipfile.BadZipFile, ValueError) as e:
+        return [str(e)]
+    
+    update_extract_job(job_id, status='running', total=len(plan))
+    if not plan:
+        return []
+    
+    # Split into a few batches per worker so each process opens the zip only a few times
+    batch_size = max(1, len(plan) // (app.config['EXTRACT_WORKERS'] * 4))
+    batches = [plan[i:i + batch_size] for i in range(0, len(plan), batch_size)]
+    
+    pool = get_extract_pool()
+    validate = app.config['VALIDATE_CONTENT']
+    errors = []
+    try:
+        futures = {pool.submit(extract_members, zip_path, batch, validate): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                # The worker itself failed (e.g. the zip vanished), so none of the batch was extracted
+                errors.append(str(e))
+                continue
+            with _extract_lock:
+                job = extract_jobs[job_id]
+                for target, written, error in results:
+                    if error:
+                        errors.append(error)
+                        continue
+                    job['extracted'] += 1
+                    job['bytes'] += written
+                    job['files'].append(os.path.basename(target))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for using too much memory); the pool can't be reused
+        discard_extract_pool(pool)
+        raise
+    
+    return errors
+
+
+def run_extraction(job_id, zip_path):
+    """Run an extraction job to a final state (runs in a thread)
+    
+    Unexpected errors mark the job failed, so it never stays queued or running.
+    """
+    try:
+        errors = extract_zip(job_id, zip_path)
+    except Exception as e:
+        app.logger.exception(f'Extraction {job_id} failed')
+        errors = [str(e) or type(e).__name__]
+    
+    if errors:
+        update_extract_job(job_id, status='failed', error='; '.join(errors))
+    else:
+        update_extract_job(job_id, status='done')
+
+
+def start_extraction(zip_path):
+    """Queue a zip for background extraction and return the job id"""
+    job_id = uuid.uuid4().hex
+    with _extract_lock:
+        # Forget the oldest finished jobs so the table stays small
+        finished = [key for key, job in extract_jobs.items() if job['status'] in ('done', 'failed')]
+        for key in finished[:max(0, len(extract_jobs) - MAX_EXTRACT_JOBS + 1)]:
+            del extract_jobs[key]
+        
+        extract_jobs[job_id] = {
+            'archive': os.path.basename(zip_path),
+            'status': 'queued',
+            'total': 0,
+            'extracted': 0,
+            'bytes': 0,
+            'files': [],
+            'error': None
+        }
+    
+    thread = threading.Thread(target=run_extraction, args=(job_id, zip_path), daemon=True)
+    thread.start()
+    return job_id
+
+
+@app.before_request
+def start_background_workers():
+    """Start the trash workers with the first request, so a crash's leftovers are unlinked"""
+    if not _trash_workers:
+        start_trash_workers()
+
+
+@app.before_request
+def start_profiling():
+    """Profile a sample of requests, or any request from a profiling admin"""
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if not rate and not app.config['PROFILE_ADMIN_TOKEN']:
+        return
+    if not is_profiling_admin() and random.random() >= rate:
+        return
+    
+    # Skip rather than wait if another request is already being profiled
+    if not _profile_lock.acquire(blocking=False):
+        return
+    
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool is active in this process
+        _profile_lock.release()
+        return
+    g.profiler = profiler
+
+
+@app.teardown_request
+def stop_profiling(error=None):
+    """Stop the request profiler and save its stats"""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    
+    try:
+        profiler.disable()
+        save_profile(profiler, request.endpoint or 'unknown')
+    except Exception as e:
+        app.logger.warning(f'Could not save request profile: {e}')
+    finally:
+        _profile_lock.release()
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """Show or change the profiling sample rate without restarting"""
+    if not is_profiling_admin():
+        return jsonify(error='Forbidden'), 403
+    
+    if request.method == 'POST':
+        try:
+            rate = float(request.form.get('sample_rate', ''))
+        except ValueError:
+            rate = math.nan
+        # NaN would slip through the clamp below and profile every request
+        if not math.isfinite(rate):
+            return jsonify(error='sample_rate must be a number'), 400
+        app.config['PROFILE_SAMPLE_RATE'] = min(max(rate, 0.0), 1.0)
+    
+    return jsonify(
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        profile_dir=app.config['PROFILE_DIR'],
+        max_files=app.config['PROFILE_MAX_FILES']
+    )
+
+
 @app.route('/')
 def index():
     """Main page - display upload form and file list"""
@@ -472,23 +1388,25 @@ def index():
         HTML_TEMPLATE,
         local_ip=local_ip,
         files=files,
+        extract_enabled=app.config['EXTRACT_ON_UPLOAD'],
         error=request.args.get('error'),
         success=request.args.get('success')
     )
 
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    """Handle file upload"""
-    # Check if file is present in request
-    if 'file' not in request.files:
-        return redirect(url_for('index', error='No file selected'))
+def store_upload(file, form):
+    """Validate a received upload and move it into storage
     
-    file = request.files['file']
+    Shared by the Flask upload route and the asyncio transfer server.
+    Returns the success message, or raises UploadRejected.
+    """
+    # Check if file is present in request
+    if file is None:
+        raise UploadRejected('No file selected')
     
     # Check if file is empty
     if file.filename == '':
-        return redirect(url_for('index', error='No file selected'))
+        raise UploadRejected('No file selected')
     
     # Check file size
     file.seek(0, os.SEEK_END)
@@ -496,69 +1414,554 @@ def upload_file():
     file.seek(0)
     
     if file_size > MAX_FILE_SIZE:
-        return redirect(url_for('index', error=f'File too large! Max size: {get_file_size(MAX_FILE_SIZE)}'))
+        raise UploadRejected(f'File too large! Max size: {get_file_size(MAX_FILE_SIZE)}')
     
     # Validate file type
     if not allowed_file(file.filename):
-        return redirect(url_for('index', error='File type not allowed'))
+        raise UploadRejected('File type not allowed')
     
     # Save file
     filename = secure_filename(file.filename)
     
-    # Handle duplicate filenames
+    # Handle duplicate filenames; the name is claimed atomically, so
+    # concurrent uploads of the same name never overwrite each other
     base, ext = os.path.splitext(filename)
     counter = 1
-    original_filename = filename
-    while os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
+    while True:
+        filepath = storage_path(filename)
+        if not find_file(filename):
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            try:
+                if isinstance(file.stream, SniffingFile):
+                    # Already validated and on disk from the single streaming pass
+                    file.stream.commit(filepath)
+                else:
+                    with open(filepath, 'xb') as f:
+                        shutil.copyfileobj(file.stream, f)
+                break
+            except FileExistsError:
+                pass
         filename = f"{base}_{counter}{ext}"
         counter += 1
     
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
+    # Keep the sender's modification time so clients can skip unchanged files
+    try:
+        mtime = float(form.get('mtime', ''))
+        if math.isfinite(mtime):
+            os.utime(filepath, (mtime, mtime))
+    except (ValueError, OverflowError, OSError):
+        pass
+    
+    # Unpack zips in the background if the uploader asked for it
+    if app.config['EXTRACT_ON_UPLOAD'] and form.get('extract') and filename.lower().endswith('.zip'):
+        job_id = start_extraction(filepath)
+        return f'File uploaded successfully: {filename} (extracting, status: /extract/{job_id})'
     
-    return redirect(url_for('index', success=f'File uploaded successfully: {filename}'))
+    return f'File uploaded successfully: {filename}'
+
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    """Handle file upload"""
+    # Rejected uploads raise UploadRejected, which redirects with the error
+    return redirect(url_for('index', success=store_upload(request.files.get('file'), request.form)))
+
+
+@app.route('/extract/<job_id>')
+def extract_status(job_id):
+    """Report the progress of a background zip extraction"""
+    with _extract_lock:
+        job = extract_jobs.get(job_id)
+        if job is None:
+            return jsonify(error='Unknown extraction job'), 404
+        return jsonify(dict(job, files=list(job['files'])))
 
 
 @app.route('/download/<filename>')
 def download_file(filename):
     """Handle file download"""
     filename = secure_filename(filename)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    
-    # Check if file exists and is safe
-    if not os.path.exists(filepath) or not os.path.isfile(filepath):
-        return redirect(url_for('index', error='File not found'))
     
     try:
-        return send_file(filepath, as_attachment=True)
+        # Hot files are served from memory (or a shared mmap) instead of reopened
+        entry = get_cached_file(storage_path(filename))
+        if entry is None:
+            # The file may not have been migrated to the current layout yet
+            filepath = find_file(filename)
+            entry = get_cached_file(filepath) if filepath else None
+        if entry is None:
+            return redirect(url_for('index', error='File not found'))
+        return send_cached_file(entry, filename)
     except Exception as e:
         return redirect(url_for('index', error=f'Error downloading file: {str(e)}'))
 
 
+@app.route('/api/files')
+def list_files_api():
+    """List shared files as JSON (used by the lanshare client)"""
+    files = []
+    for entry in iter_stored_files():
+        file_stat = entry.stat()
+        files.append({'name': entry.name, 'size': file_stat.st_size, 'mtime': file_stat.st_mtime})
+    return jsonify(files)
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Report download cache hit/miss counters"""
+    with _file_cache_lock:
+        return jsonify(dict(file_cache_stats, entries=len(_file_cache)))
+
+
 @app.route('/delete/<filename>', methods=['POST'])
 def delete_file(filename):
     """Handle file deletion"""
     filename = secure_filename(filename)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    filepath = find_file(filename)
     
     # Check if file exists and is safe
-    if not os.path.exists(filepath) or not os.path.isfile(filepath):
+    if filepath is None:
         return redirect(url_for('index', error='File not found'))
     
     try:
-        os.remove(filepath)
+        move_to_trash(filepath)
         return redirect(url_for('index', success=f'File deleted: {filename}'))
     except Exception as e:
         return redirect(url_for('index', error=f'Error deleting file: {str(e)}'))
 
 
+@app.route('/delete', methods=['POST'])
+def bulk_delete():
+    """Handle deleting many files at once
+    
+    Form fields (at least one is required):
+        filenames   - repeated, the files to delete
+        older_than  - only delete files last modified more than this many days ago
+        extension   - only delete files with this extension
+    Without filenames, the filters apply to every shared file.
+    """
+    filenames = [secure_filename(name) for name in request.form.getlist('filenames')]
+    older_than = request.form.get('older_than', '').strip()
+    extension = request.form.get('extension', '').strip().lstrip('.').lower()
+    
+    if not filenames and not older_than and not extension:
+        return redirect(url_for('index', error='No files selected'))
+    
+    if filenames:
+        candidates = [(filename, find_file(filename)) for filename in filenames if filename]
+    else:
+        candidates = [(entry.name, entry.path) for entry in iter_stored_files()]
+    
+    cutoff = None
+    if older_than:
+        try:
+            days = float(older_than)
+        except ValueError:
+            days = None
+        # Reject nan, inf and non-positive values, which would select every file
+        if days is None or not math.isfinite(days) or days <= 0:
+            return redirect(url_for('index', error='older_than must be a number of days'))
+        cutoff = time.time() - days * 24 * 60 * 60
+    
+    deleted = 0
+    for filename, filepath in candidates:
+        if filepath is None:
+            continue
+        try:
+            file_stat = os.stat(filepath)
+        except OSError:
+            continue
+        if extension and not filename.lower().endswith('.' + extension):
+            continue
+        if cutoff is not None and file_stat.st_mtime >= cutoff:
+            continue
+        
+        try:
+            move_to_trash(filepath)
+            deleted += 1
+        except OSError as e:
+            app.logger.warning(f'Could not delete {filename}: {e}')
+    
+    return redirect(url_for('index', success=f'Deleted {deleted} file(s)'))
+
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(error):
+    """Handle an upload stopped by content validation"""
+    return redirect(url_for('index', error=str(error)))
+
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large error"""
     return redirect(url_for('index', error=f'File too large! Max size: {get_file_size(MAX_FILE_SIZE)}'))
 
 
+class AsyncTransferServer:
+    """Asyncio HTTP server for many slow, concurrent transfers
+    
+    Uploads (POST /upload) and downloads (GET/HEAD /download/<filename>) are
+    handled on the event loop with non-blocking sockets, so a client
+    trickling data over weak WiFi costs a coroutine instead of a thread.
+    Disk I/O runs on a small thread pool. Each connection holds at most one
+    chunk in memory: the next chunk isn't read until the previous one is on
+    disk, and writes wait for the socket to drain. Every other request is
+    passed to the Flask app on a separate thread pool, so the HTML page and
+    the JSON endpoints behave as usual.
+    """
+    
+    def __init__(self):
+        self.io_pool = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix='transfer-io')
+        self.wsgi_pool = ThreadPoolExecutor(max_workers=ASYNC_WSGI_WORKERS, thread_name_prefix='transfer-wsgi')
+    
+    async def run_io(self, func, *args):
+        """Run a blocking file operation on the I/O pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.io_pool, func, *args)
+    
+    async def start(self, host, port):
+        """Start listening and return the asyncio server"""
+        # The stream limit also pauses reading from a socket whose buffer is full
+        return await asyncio.start_server(self.handle_connection, host, port, limit=ASYNC_CHUNK_SIZE)
+    
+    async def serve(self, host, port):
+        """Serve forever"""
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+    
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one keep-alive connection"""
+        try:
+            while await self.handle_request(reader, writer):
+                pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        except Exception as e:
+            app.logger.exception(f'Transfer failed: {e}')
+        finally:
+            writer.close()
+    
+    async def handle_request(self, reader, writer):
+        """Serve one request and return whether the connection can be reused"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), ASYNC_IDLE_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+            return False  # Client closed an idle connection
+        
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            await self.send_error(writer, '400 BAD REQUEST')
+            return False
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        
+        # Chunked bodies aren't decoded; the length must be known to find the next request
+        if 'transfer-encoding' in headers:
+            await self.send_error(writer, '411 LENGTH REQUIRED')
+            return False
+        
+        path, _, query = target.partition('?')
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        request_info = {'method': method, 'path': path, 'query': query, 'version': version, 'headers': headers}
+        
+        if path == '/upload' and method == 'POST':
+            return await self.handle_upload(reader, writer, request_info) and keep_alive
+        if path.startswith('/download/') and method in ('GET', 'HEAD'):
+            await self.handle_download(writer, request_info)
+            return keep_alive
+        return await self.handle_wsgi(reader, writer, request_info) and keep_alive
+    
+    async def send_head(self, writer, status, headers):
+        """Write the status line and headers"""
+        lines = [f'HTTP/1.1 {status}'] + [f'{name}: {value}' for name, value in headers]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+    
+    async def send_error(self, writer, status):
+        """Reply with an empty error response and close the connection"""
+        await self.send_head(writer, status, [('Content-Length', '0'), ('Connection', 'close')])
+    
+    def get_content_length(self, headers):
+        """Get the request's Content-Length (0 if absent), or None if it isn't valid"""
+        value = headers.get('content-length') or '0'
+        return int(value) if value.isascii() and value.isdigit() else None
+    
+    async def send_redirect(self, writer, keep_alive=True, **message):
+        """Redirect to the main page with an error or success message"""
+        await self.send_head(writer, '302 FOUND', [
+            ('Location', '/?' + urlencode(message)),
+            ('Content-Length', '0'),
+            ('Connection', 'keep-alive' if keep_alive else 'close')
+        ])
+    
+    async def read_body(self, reader, length, end_marker=False):
+        """Yield the request body in chunks, waiting at most the idle timeout for each
+        
+        With end_marker, None is yielded after the last chunk.
+        """
+        while length > 0:
+            chunk = await asyncio.wait_for(reader.read(min(ASYNC_CHUNK_SIZE, length)), ASYNC_IDLE_TIMEOUT)
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', length)
+            length -= len(chunk)
+            yield chunk
+        if end_marker:
+            yield None
+    
+    async def handle_upload(self, reader, writer, request_info):
+        """Stream a multipart upload to disk, validating it on the way"""
+        headers = request_info['headers']
+        content_type, options = parse_options_header(headers.get('content-type', ''))
+        if 'content-length' not in headers:
+            await self.send_error(writer, '411 LENGTH REQUIRED')
+            return False
+        length = self.get_content_length(headers)
+        if length is None:
+            await self.send_error(writer, '400 BAD REQUEST')
+            return False
+        
+        if length > MAX_FILE_SIZE:
+            await self.send_redirect(writer, False, error=f'File too large! Max size: {get_file_size(MAX_FILE_SIZE)}')
+            return False
+        if content_type != 'multipart/form-data' or 'boundary' not in options:
+            await self.send_redirect(writer, False, error='No file selected')
+            return False
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        
+        decoder = MultipartDecoder(options['boundary'].encode('latin-1'), max_form_memory_size=ASYNC_MAX_FORM_SIZE)
+        form = MultiDict()
+        upload = None
+        part = None
+        writing_upload = False
+        field_data = []
+        
+        try:
+            done = False
+            async for chunk in self.read_body(reader, length, end_marker=True):
+                decoder.receive_data(chunk)
+                event = decoder.next_event()
+                while not isinstance(event, (NeedData, Epilogue)):
+                    if isinstance(event, Field):
+                        part, field_data, writing_upload = event, [], False
+                    elif isinstance(event, File):
+                        part = event
+                        writing_upload = upload is None and event.name == 'file' and bool(event.filename)
+                        if writing_upload:
+                            upload = await self.run_io(SniffingFile, event.filename, app.config['VALIDATE_CONTENT'])
+                    elif isinstance(event, Data):
+                        if isinstance(part, Field):
+                            field_data.append(event.data)
+                            if not event.more_data:
+                                form.add(part.name, b''.join(field_data).decode('utf-8', 'replace'))
+                        elif writing_upload:
+                            # Backpressure: the next chunk is only read once this one is written
+                            await self.run_io(upload.write, event.data)
+                    event = decoder.next_event()
+                if isinstance(event, Epilogue):
+                    done = True
+                    break
+            
+            if not done:
+                raise UploadRejected('Upload was cut short')
+            if upload is None:
+                raise UploadRejected('No file selected')
+            await self.run_io(upload.seek, 0)
+            
+            file = FileStorage(upload, upload.filename, 'file')
+            message = await self.run_io(store_upload, file, form)
+        except UploadRejected as e:
+            # The rest of the body was never read, so the connection can't be reused
+            await self.send_redirect(writer, False, error=str(e))
+            return False
+        except ValueError:
+            # Malformed multipart body
+            await self.send_redirect(writer, False, error='Invalid upload')
+            return False
+        finally:
+            if upload is not None:
+                await self.run_io(upload.close)
+        
+        await self.send_redirect(writer, success=message)
+        return True
+    
+    async def handle_download(self, writer, request_info):
+        """Stream a file from the download cache, honouring a single byte range"""
+        filename = secure_filename(unquote(request_info['path'][len('/download/'):]))
+        entry = await self.run_io(get_cached_file, storage_path(filename))
+        if entry is None:
+            filepath = await self.run_io(find_file, filename)
+            entry = await self.run_io(get_cached_file, filepath) if filepath else None
+        if entry is None:
+            await self.send_redirect(writer, error='File not found')
+            return
+        
+        size = entry['size']
+        start, end = 0, size - 1
+        status = '200 OK'
+        etag = '"' + '-'.join(str(part) for part in entry['key']) + '"'
+        last_modified = formatdate(entry['mtime'], usegmt=True)
+        validators = [
+            ('Last-Modified', last_modified),
+            ('ETag', etag),
+            ('Cache-Control', 'no-cache')
+        ]
+        headers = validators + [
+            ('Content-Type', mimetypes.guess_type(filename)[0] or 'application/octet-stream'),
+            ('Content-Disposition', f'attachment; filename="{filename}"'),
+            ('Accept-Ranges', 'bytes')
+        ]
+        
+        # Same conditional and range rules as Response.make_conditional in the Flask route
+        environ = {'REQUEST_METHOD': request_info['method']}
+        for name in ('if-none-match', 'if-modified-since', 'if-range', 'range'):
+            if name in request_info['headers']:
+                environ['HTTP_' + name.upper().replace('-', '_')] = request_info['headers'][name]
+        
+        if size > 0 and 'HTTP_RANGE' in environ and (
+                'HTTP_IF_RANGE' not in environ
+                or not is_resource_modified(environ, etag, last_modified=last_modified, ignore_if_range=False)):
+            # A malformed Range header is ignored and the whole file is sent
+            byte_range = parse_range_header(environ['HTTP_RANGE'])
+            if byte_range is not None:
+                # None for unsatisfiable ranges, and for multiple ranges, which aren't supported
+                bounds = byte_range.range_for_length(size)
+                if bounds is None:
+                    await self.send_head(writer, '416 RANGE NOT SATISFIABLE', [
+                        ('Content-Range', f'bytes */{size}'), ('Content-Length', '0')])
+                    return
+                start, end = bounds[0], bounds[1] - 1
+                status = '206 PARTIAL CONTENT'
+                headers.append(('Content-Range', byte_range.to_content_range_header(size)))
+        
+        if status == '200 OK' and not is_resource_modified(environ, etag, last_modified=last_modified):
+            await self.send_head(writer, '304 NOT MODIFIED', validators)
+            return
+        
+        headers.append(('Content-Length', str(end - start + 1)))
+        await self.send_head(writer, status, headers)
+        if request_info['method'] == 'HEAD':
+            return
+        
+        if entry['buffer'] is None:
+            reader = await self.run_io(open, entry['path'], 'rb')
+        else:
+            reader = CachedFileReader(entry['buffer'])
+        in_memory = isinstance(entry['buffer'], bytes)
+        try:
+            reader.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                size_to_read = min(ASYNC_CHUNK_SIZE, remaining)
+                # mmap reads can fault pages in from disk, so keep them off the loop
+                chunk = reader.read(size_to_read) if in_memory else await self.run_io(reader.read, size_to_read)
+                remaining -= len(chunk)
+                writer.write(chunk)
+                await asyncio.wait_for(writer.drain(), ASYNC_IDLE_TIMEOUT)
+        finally:
+            reader.close()
+    
+    async def handle_wsgi(self, reader, writer, request_info):
+        """Pass a request to the Flask app"""
+        headers = request_info['headers']
+        length = self.get_content_length(headers)
+        if length is None:
+            await self.send_error(writer, '400 BAD REQUEST')
+            return False
+        if length > ASYNC_MAX_FORM_SIZE:
+            await self.send_error(writer, '413 REQUEST ENTITY TOO LARGE')
+            return False
+        body = b''.join([chunk async for chunk in self.read_body(reader, length)])
+        
+        host, port = (writer.get_extra_info('sockname') or ('', 0))[:2]
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': request_info['method'],
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(request_info['path']).decode('latin-1'),
+            'QUERY_STRING': request_info['query'],
+            'SERVER_NAME': str(host),
+            'SERVER_PORT': str(port),
+            'SERVER_PROTOCOL': request_info['version'],
+            'REMOTE_ADDR': peer[0],
+            'CONTENT_TYPE': headers.get('content-type', ''),
+            'CONTENT_LENGTH': str(length) if length else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in headers.items():
+            if name not in ('content-type', 'content-length'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        
+        status, response_headers, data = await asyncio.get_running_loop().run_in_executor(
+            self.wsgi_pool, self.call_wsgi, environ)
+        
+        response_headers = [(name, value) for name, value in response_headers
+                            if name.lower() not in ('content-length', 'connection', 'transfer-encoding')]
+        response_headers.append(('Content-Length', str(len(data))))
+        await self.send_head(writer, status, response_headers)
+        if request_info['method'] != 'HEAD':
+            writer.write(data)
+            await asyncio.wait_for(writer.drain(), ASYNC_IDLE_TIMEOUT)
+        return True
+    
+    def call_wsgi(self, environ):
+        """Run the Flask app and collect its response (runs in a thread)"""
+        response = {}
+        chunks = []
+        
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            return chunks.append
+        
+        result = app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+
+def run_async_server(host, port):
+    """Run the asyncio transfer server until interrupted"""
+    # Transfers bypass Flask's before_request hooks
+    start_trash_workers()
+    try:
+        asyncio.run(AsyncTransferServer().serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LAN File Share Server')
+    parser.add_argument('--migrate-storage', choices=['flat', 'sharded'],
+                        help='move existing files into this storage layout and exit '
+                             '(safe while the server is running)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='serve uploads and downloads with the asyncio transfer server, '
+                             'for many slow clients at once')
+    args = parser.parse_args()
+    
+    if args.migrate_storage:
+        moved = migrate_storage(args.migrate_storage)
+        print(f"✅ Moved {moved} file(s) to the {args.migrate_storage} layout")
+        print(f"💡 Set STORAGE_LAYOUT = '{args.migrate_storage}' so new uploads use it too")
+        raise SystemExit(0)
+    
     local_ip = get_local_ip()
     print("\n" + "="*60)
     print("🎉 LAN FILE SHARE SERVER STARTED")
@@ -568,6 +1971,11 @@ if __name__ == '__main__':
     print(f"💡 Tip: Access from any device on the same WiFi network")
     print("="*60 + "\n")
     
+    if args.use_async:
+        print("⚡ Serving transfers with the asyncio engine")
+        run_async_server('0.0.0.0', 5000)
+        raise SystemExit(0)
+    
     # Run Flask app
     app.run(
         host='0.0.0.0',  # Listen on all network interfaces
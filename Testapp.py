@@ -6,7 +6,24 @@ Run with: pytest test_app.py
 import unittest
 import os
 import json
-from app import app, UPLOAD_FOLDER
+import io
+import re
+import socket
+import asyncio
+import shutil
+import stat
+import tempfile
+import time
+import zipfile
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
+import threading
+from werkzeug.serving import make_server
+import lanshare
+from app import (app, UPLOAD_FOLDER, TRASH_FOLDER, file_cache_stats, get_cached_file, trash_queue,
+                 storage_path, migrate_storage, iter_stored_files, INCOMING_FOLDER, CONTENT_VALIDATORS, content_validator,
+                 AsyncTransferServer, extract_members, start_extraction, get_extract_pool)
 
 
 class TestLANFileShare(unittest.TestCase):
@@ -127,6 +144,814 @@ class TestLANFileShare(unittest.TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+class SharedFilesTestCase(unittest.TestCase):
+    """Base for test cases that write to the upload folder"""
+    
+    def setUp(self):
+        """Set up the test client and make sure the upload folder exists"""
+        self.client = app.test_client()
+        if not os.path.exists(UPLOAD_FOLDER):
+            os.makedirs(UPLOAD_FOLDER)
+    
+    def tearDown(self):
+        """Remove test files, shard folders and leftover upload spools"""
+        trash_queue.join()
+        for filename in os.listdir(UPLOAD_FOLDER):
+            filepath = os.path.join(UPLOAD_FOLDER, filename)
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+            elif not filename.startswith('.'):
+                shutil.rmtree(filepath)
+        if os.path.exists(INCOMING_FOLDER):
+            for filename in os.listdir(INCOMING_FOLDER):
+                os.remove(os.path.join(INCOMING_FOLDER, filename))
+
+
+class LiveServerTestCase(SharedFilesTestCase):
+    """Base for test cases talking to a server on cls.port through lanshare"""
+    
+    def setUp(self):
+        """Create a client and a scratch folder"""
+        super().setUp()
+        self.pool = lanshare.ConnectionPool(f'http://127.0.0.1:{self.port}')
+        self.work_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """Close connections and remove scratch and test files"""
+        self.pool.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        super().tearDown()
+
+
+class TestRequestProfiling(unittest.TestCase):
+    """Test cases for sampled request profiling"""
+    
+    def setUp(self):
+        """Point profile dumps at a temporary folder"""
+        self.client = app.test_client()
+        self.profile_dir = tempfile.mkdtemp()
+        self.saved_config = {key: app.config[key] for key in
+                             ('PROFILE_SAMPLE_RATE', 'PROFILE_ADMIN_TOKEN', 'PROFILE_DIR', 'PROFILE_MAX_FILES')}
+        app.config['PROFILE_DIR'] = self.profile_dir
+    
+    def tearDown(self):
+        """Restore profiling settings"""
+        app.config.update(self.saved_config)
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+    
+    def test_disabled_by_default(self):
+        """Test that nothing is profiled when sampling is off"""
+        app.config['PROFILE_SAMPLE_RATE'] = 0.0
+        self.client.get('/')
+        self.assertEqual(os.listdir(self.profile_dir), [])
+    
+    def test_sampled_request_writes_pstats(self):
+        """Test that a sampled request writes a per-route .pstats file"""
+        app.config['PROFILE_SAMPLE_RATE'] = 1.0
+        self.client.get('/')
+        dumps = os.listdir(self.profile_dir)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].startswith('index-'))
+        self.assertTrue(dumps[0].endswith('.pstats'))
+    
+    def test_admin_header_forces_profiling(self):
+        """Test that the admin header profiles a request even when sampling is off"""
+        app.config['PROFILE_SAMPLE_RATE'] = 0.0
+        app.config['PROFILE_ADMIN_TOKEN'] = 'secret'
+        self.client.get('/', headers={'X-Profile': 'wrong'})
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.client.get('/', headers={'X-Profile': 'secret'})
+        self.assertEqual(len(os.listdir(self.profile_dir)), 1)
+    
+    def test_old_dumps_are_rotated(self):
+        """Test that the profile folder keeps only the newest dumps"""
+        app.config['PROFILE_SAMPLE_RATE'] = 1.0
+        app.config['PROFILE_MAX_FILES'] = 2
+        for _ in range(4):
+            self.client.get('/')
+        self.assertEqual(len(os.listdir(self.profile_dir)), 2)
+    
+    def test_sample_rate_switchable_at_runtime(self):
+        """Test that an admin can change the sample rate without a restart"""
+        app.config['PROFILE_ADMIN_TOKEN'] = 'secret'
+        response = self.client.post('/admin/profiling', data={'sample_rate': '0.25'})
+        self.assertEqual(response.status_code, 403)
+        
+        response = self.client.post('/admin/profiling', data={'sample_rate': '0.25'},
+                                    headers={'X-Profile': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['sample_rate'], 0.25)
+        self.assertEqual(app.config['PROFILE_SAMPLE_RATE'], 0.25)
+    
+    def test_non_finite_sample_rate_rejected(self):
+        """Test that NaN and infinite sample rates are refused"""
+        app.config['PROFILE_ADMIN_TOKEN'] = 'secret'
+        app.config['PROFILE_SAMPLE_RATE'] = 0.0
+        for value in ('nan', 'inf', '-inf'):
+            response = self.client.post('/admin/profiling', data={'sample_rate': value},
+                                        headers={'X-Profile': 'secret'})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(app.config['PROFILE_SAMPLE_RATE'], 0.0)
+
+
+class TestZipExtraction(SharedFilesTestCase):
+    """Test cases for server-side zip extraction"""
+    
+    def setUp(self):
+        """Enable extraction and set up the test client"""
+        super().setUp()
+        app.config['EXTRACT_ON_UPLOAD'] = True
+    
+    def tearDown(self):
+        """Disable extraction and remove test files"""
+        app.config['EXTRACT_ON_UPLOAD'] = False
+        super().tearDown()
+    
+    def make_zip(self, members):
+        """Build an in-memory zip from a {name: bytes} dict"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+        buffer.seek(0)
+        return buffer
+    
+    def upload_and_wait(self, members):
+        """Upload a zip with extraction requested and wait for the job to finish"""
+        response = self.client.post(
+            '/upload',
+            data={'file': (self.make_zip(members), 'bundle.zip'), 'extract': '1'}
+        )
+        self.assertEqual(response.status_code, 302)
+        success = parse_qs(urlparse(response.location).query)['success'][0]
+        return self.wait_for_job(re.search(r'/extract/\w+', success).group(0))
+    
+    def wait_for_job(self, job_url):
+        """Poll an extraction job until it reaches a final state"""
+        for _ in range(200):
+            job = self.client.get(job_url).get_json()
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.05)
+        self.fail('Extraction did not finish')
+    
+    def test_zip_is_extracted(self):
+        """Test that zip members end up in the upload folder"""
+        job = self.upload_and_wait({'a.txt': b'alpha', 'docs/b.txt': b'bravo'})
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['extracted'], 2)
+        with open(os.path.join(UPLOAD_FOLDER, 'a.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'alpha')
+        self.assertTrue(os.path.exists(os.path.join(UPLOAD_FOLDER, 'b.txt')))
+    
+    def test_path_traversal_is_flattened(self):
+        """Test that members cannot escape the upload folder"""
+        job = self.upload_and_wait({'../../escape.txt': b'nope'})
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['files'], ['escape.txt'])
+        self.assertTrue(os.path.exists(os.path.join(UPLOAD_FOLDER, 'escape.txt')))
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, '..', '..', 'escape.txt')))
+    
+    def test_mismatched_member_is_not_extracted(self):
+        """Test that zip members are content-checked like uploads"""
+        job = self.upload_and_wait({'x.txt': b'\x7fELF\x02\x01\x01\x00' * 100, 'ok.txt': b'fine'})
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('x.txt', job['error'])
+        self.assertEqual(job['files'], ['ok.txt'])
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'x.txt')))
+    
+    def test_missing_zip_fails_the_job(self):
+        """Test that a zip removed before extraction starts doesn't leave the job queued"""
+        job_id = start_extraction(os.path.join(UPLOAD_FOLDER, 'gone.zip'))
+        job = self.wait_for_job(f'/extract/{job_id}')
+        self.assertEqual(job['status'], 'failed')
+    
+    def test_broken_pool_is_replaced(self):
+        """Test that a dead worker fails the job and the next job gets a new pool"""
+        with self.assertRaises(BrokenProcessPool):
+            get_extract_pool().submit(os._exit, 1).result()
+        
+        job = self.upload_and_wait({'a.txt': b'alpha'})
+        self.assertEqual(job['status'], 'failed')
+        job = self.upload_and_wait({'b.txt': b'bravo'})
+        self.assertEqual(job['status'], 'done')
+    
+    def test_zip_bomb_is_rejected(self):
+        """Test that an archive with an extreme compression ratio is refused"""
+        job = self.upload_and_wait({'bomb.txt': b'0' * (10 * 1024 * 1024)})
+        self.assertEqual(job['status'], 'failed')
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'bomb.txt')))
+    
+    def test_failed_member_does_not_stop_batch(self):
+        """Test that one bad member is reported without losing the others"""
+        zip_path = os.path.join(UPLOAD_FOLDER, 'batch.zip')
+        with open(zip_path, 'wb') as f:
+            f.write(self.make_zip({'good.txt': b'good', 'also.txt': b'also'}).getvalue())
+        
+        members = [
+            ('good.txt', os.path.join(UPLOAD_FOLDER, 'good.txt'), 4),
+            ('missing.txt', os.path.join(UPLOAD_FOLDER, 'missing.txt'), 4),
+            ('also.txt', os.path.join(UPLOAD_FOLDER, 'also.txt'), 2),
+        ]
+        results = extract_members(zip_path, members)
+        
+        self.assertIsNone(results[0][2])
+        self.assertIsNotNone(results[1][2])
+        self.assertIn('larger than its header', results[2][2])
+        self.assertTrue(os.path.exists(os.path.join(UPLOAD_FOLDER, 'good.txt')))
+        # Failed members leave nothing behind, not even an empty file
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'missing.txt')))
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'also.txt')))
+    
+    def test_unknown_job(self):
+        """Test that an unknown job id returns 404"""
+        response = self.client.get('/extract/missing')
+        self.assertEqual(response.status_code, 404)
+
+
+class TestDownloadCache(SharedFilesTestCase):
+    """Test cases for the hot-file download cache"""
+    
+    def setUp(self):
+        """Set up the test client and a test file"""
+        super().setUp()
+        self.saved_item_size = app.config['FILE_CACHE_MAX_ITEM_SIZE']
+        self.filepath = os.path.join(UPLOAD_FOLDER, 'cached.txt')
+        self.write_file(b'first version')
+    
+    def tearDown(self):
+        """Restore settings and remove the test file"""
+        app.config['FILE_CACHE_MAX_ITEM_SIZE'] = self.saved_item_size
+        super().tearDown()
+    
+    def write_file(self, data):
+        """Replace the test file the way an upload would"""
+        tmp_path = self.filepath + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.filepath)
+    
+    def test_repeat_download_is_a_hit(self):
+        """Test that downloading the same file twice hits the cache"""
+        self.client.get('/download/cached.txt')
+        hits = file_cache_stats['hits']
+        response = self.client.get('/download/cached.txt')
+        self.assertEqual(response.data, b'first version')
+        self.assertEqual(file_cache_stats['hits'], hits + 1)
+        
+        stats = self.client.get('/cache/stats').get_json()
+        self.assertIn('misses', stats)
+    
+    def test_replaced_file_is_not_stale(self):
+        """Test that replacing a file invalidates its cached copy"""
+        self.client.get('/download/cached.txt')
+        self.write_file(b'second version, longer')
+        response = self.client.get('/download/cached.txt')
+        self.assertEqual(response.data, b'second version, longer')
+    
+    def test_deleted_file_is_not_served(self):
+        """Test that a deleted file is no longer served from the cache"""
+        self.client.get('/download/cached.txt')
+        self.client.post('/delete/cached.txt')
+        response = self.client.get('/download/cached.txt')
+        self.assertEqual(response.status_code, 302)
+    
+    def test_large_file_is_mmapped(self):
+        """Test that files over the item limit are served through mmap"""
+        app.config['FILE_CACHE_MAX_ITEM_SIZE'] = 4
+        self.write_file(b'a larger file served via mmap')
+        response = self.client.get('/download/cached.txt')
+        self.assertEqual(response.data, b'a larger file served via mmap')
+    
+    def test_failed_load_streams_from_disk(self):
+        """Test that a file that can't be cached is still downloaded"""
+        with mock.patch('app.load_cache_entry', side_effect=OSError('Too many open files')):
+            response = self.client.get('/download/cached.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'first version')
+    
+    def test_large_file_without_mmap_streams_from_disk(self):
+        """Test that large files are streamed from disk where mmap isn't used"""
+        app.config['FILE_CACHE_MAX_ITEM_SIZE'] = 4
+        self.write_file(b'a larger file read from disk')
+        with mock.patch('app.FILE_CACHE_USE_MMAP', False):
+            response = self.client.get('/download/cached.txt')
+            self.assertIsNone(get_cached_file(self.filepath)['buffer'])
+        self.assertEqual(response.data, b'a larger file read from disk')
+    
+    def test_range_request(self):
+        """Test that byte ranges are served from the cached buffer"""
+        response = self.client.get('/download/cached.txt', headers={'Range': 'bytes=6-12'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'version')
+    
+    def test_concurrent_downloads_share_one_load(self):
+        """Test that concurrent downloads of a new file load it only once"""
+        self.write_file(b'shared by everyone')
+        misses = file_cache_stats['misses']
+        results = []
+        
+        def download():
+            results.append(app.test_client().get('/download/cached.txt').data)
+        
+        threads = [threading.Thread(target=download) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, [b'shared by everyone'] * 8)
+        self.assertEqual(file_cache_stats['misses'], misses + 1)
+
+
+class TestBulkDelete(SharedFilesTestCase):
+    """Test cases for bulk deletion through the trash queue"""
+    
+    def setUp(self):
+        """Set up the test client and some test files"""
+        super().setUp()
+        for filename in ('a.txt', 'b.txt', 'c.csv'):
+            with open(os.path.join(UPLOAD_FOLDER, filename), 'w') as f:
+                f.write('test content')
+    
+    def remaining(self):
+        """List the shared files still visible"""
+        return sorted(name for name in os.listdir(UPLOAD_FOLDER)
+                      if os.path.isfile(os.path.join(UPLOAD_FOLDER, name)))
+    
+    def test_delete_by_names(self):
+        """Test deleting a list of files in one request"""
+        response = self.client.post('/delete', data={'filenames': ['a.txt', 'b.txt', 'missing.txt']})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('Deleted+2', response.location)
+        self.assertEqual(self.remaining(), ['c.csv'])
+    
+    def test_delete_by_extension(self):
+        """Test deleting every file with an extension"""
+        self.client.post('/delete', data={'extension': 'txt'})
+        self.assertEqual(self.remaining(), ['c.csv'])
+    
+    def test_delete_older_than(self):
+        """Test deleting only files older than a number of days"""
+        old_time = time.time() - 10 * 24 * 60 * 60
+        os.utime(os.path.join(UPLOAD_FOLDER, 'a.txt'), (old_time, old_time))
+        self.client.post('/delete', data={'older_than': '7'})
+        self.assertEqual(self.remaining(), ['b.txt', 'c.csv'])
+    
+    def test_delete_rejects_invalid_age(self):
+        """Test that nan, inf and non-positive ages don't delete anything"""
+        for older_than in ['nan', 'inf', '-inf', '0', '-3', 'soon']:
+            response = self.client.post('/delete', data={'older_than': older_than})
+            self.assertIn('older_than+must+be+a+number+of+days', response.location)
+        self.assertEqual(self.remaining(), ['a.txt', 'b.txt', 'c.csv'])
+    
+    def test_delete_requires_selection(self):
+        """Test that an empty bulk delete does not remove everything"""
+        response = self.client.post('/delete', data={})
+        self.assertIn('error', response.location)
+        self.assertEqual(self.remaining(), ['a.txt', 'b.txt', 'c.csv'])
+    
+    def test_leftover_trash_is_emptied_on_start(self):
+        """Test that files trashed before a restart are unlinked without a new delete"""
+        os.makedirs(TRASH_FOLDER, exist_ok=True)
+        with open(os.path.join(TRASH_FOLDER, 'leftover.txt'), 'w') as f:
+            f.write('trashed before a crash')
+        with mock.patch('app._trash_workers', []):
+            self.client.get('/')
+            trash_queue.join()
+        self.assertEqual(os.listdir(TRASH_FOLDER), [])
+    
+    def test_trash_is_emptied_in_background(self):
+        """Test that trashed files are eventually unlinked"""
+        self.client.post('/delete', data={'filenames': ['a.txt', 'b.txt', 'c.csv']})
+        trash_queue.join()
+        self.assertEqual(os.listdir(TRASH_FOLDER), [])
+
+
+class TestShardedStorage(SharedFilesTestCase):
+    """Test cases for the sharded storage layout"""
+    
+    def setUp(self):
+        """Switch to the sharded layout and set up the test client"""
+        super().setUp()
+        app.config['STORAGE_LAYOUT'] = 'sharded'
+    
+    def tearDown(self):
+        """Restore the flat layout and remove test files and shard folders"""
+        app.config['STORAGE_LAYOUT'] = 'flat'
+        super().tearDown()
+    
+    def test_shard_path(self):
+        """Test that sharded paths are stable hash-prefixed subfolders"""
+        path = storage_path('report.pdf')
+        self.assertEqual(path, storage_path('report.pdf'))
+        parts = os.path.relpath(path, UPLOAD_FOLDER).split(os.sep)
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(parts[-1], 'report.pdf')
+    
+    def test_upload_list_download_delete(self):
+        """Test that sharded files keep their flat names and URLs"""
+        response = self.client.post('/upload', data={'file': (io.BytesIO(b'sharded'), 'notes.txt')})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(os.path.isfile(storage_path('notes.txt')))
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'notes.txt')))
+        
+        self.assertIn(b'/download/notes.txt', self.client.get('/').data)
+        self.assertEqual(self.client.get('/download/notes.txt').data, b'sharded')
+        
+        self.client.post('/delete/notes.txt')
+        self.assertFalse(os.path.exists(storage_path('notes.txt')))
+    
+    def test_duplicate_names_are_renamed(self):
+        """Test that duplicate uploads are detected across shards"""
+        for _ in range(2):
+            self.client.post('/upload', data={'file': (io.BytesIO(b'x'), 'dup.txt')})
+        self.assertTrue(os.path.isfile(storage_path('dup.txt')))
+        self.assertTrue(os.path.isfile(storage_path('dup_1.txt')))
+    
+    def test_migration_round_trip(self):
+        """Test migrating a flat folder to sharded and back"""
+        flat_path = os.path.join(UPLOAD_FOLDER, 'old.txt')
+        with open(flat_path, 'w') as f:
+            f.write('legacy')
+        
+        # Not migrated yet, but still downloadable
+        self.assertEqual(self.client.get('/download/old.txt').data, b'legacy')
+        
+        self.assertEqual(migrate_storage('sharded'), 1)
+        self.assertFalse(os.path.exists(flat_path))
+        self.assertEqual(self.client.get('/download/old.txt').data, b'legacy')
+        
+        self.assertEqual(migrate_storage('flat'), 1)
+        self.assertTrue(os.path.isfile(flat_path))
+        self.assertEqual([name for name in os.listdir(UPLOAD_FOLDER) if not name.startswith('.')], ['old.txt'])
+
+
+class TestLanshareClient(LiveServerTestCase):
+    """Test cases for the lanshare command-line client against a live server"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Start the app on a free port in a background thread"""
+        cls.server = make_server('127.0.0.1', 0, app, threaded=True)
+        cls.port = cls.server.server_port
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the server"""
+        cls.server.shutdown()
+    
+    def test_segmented_download(self):
+        """Test that a file downloaded in segments matches the original"""
+        data = os.urandom(3 * lanshare.MIN_SEGMENT_SIZE + 12345)
+        with open(os.path.join(UPLOAD_FOLDER, 'big.bin'), 'wb') as f:
+            f.write(data)
+        
+        output = os.path.join(self.work_dir, 'big.bin')
+        lanshare.download(self.pool, 'big.bin', output, segments=3)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), data)
+    
+    def test_download_missing_file(self):
+        """Test that downloading a missing file fails cleanly"""
+        with self.assertRaises(RuntimeError):
+            lanshare.download(self.pool, 'missing.txt', os.path.join(self.work_dir, 'missing.txt'))
+    
+    def test_push_skips_unchanged_files(self):
+        """Test that pushing a directory twice only uploads changed files"""
+        os.makedirs(os.path.join(self.work_dir, 'sub'))
+        for name in ('one.txt', os.path.join('sub', 'two.txt')):
+            with open(os.path.join(self.work_dir, name), 'w') as f:
+                f.write(f'content of {name}')
+        
+        self.assertTrue(lanshare.push(self.pool, self.work_dir, jobs=2))
+        with open(os.path.join(UPLOAD_FOLDER, 'two.txt')) as f:
+            self.assertEqual(f.read(), f"content of {os.path.join('sub', 'two.txt')}")
+        
+        remote = lanshare.get_remote_files(self.pool)
+        local_mtime = os.path.getmtime(os.path.join(self.work_dir, 'one.txt'))
+        self.assertEqual(int(remote['one.txt'][1]), int(local_mtime))
+        
+        # Nothing changed, so a second push must not create duplicates
+        self.assertTrue(lanshare.push(self.pool, self.work_dir, jobs=2))
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'one_1.txt')))
+    
+    def test_push_does_not_duplicate_changed_files(self):
+        """Test that a file changed locally is reported, not uploaded as a copy"""
+        filepath = os.path.join(self.work_dir, 'notes.txt')
+        with open(filepath, 'w') as f:
+            f.write('first draft')
+        self.assertTrue(lanshare.push(self.pool, self.work_dir))
+        
+        with open(filepath, 'w') as f:
+            f.write('second, longer draft')
+        self.assertFalse(lanshare.push(self.pool, self.work_dir))
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'notes_1.txt')))
+        with open(os.path.join(UPLOAD_FOLDER, 'notes.txt')) as f:
+            self.assertEqual(f.read(), 'first draft')
+        
+        # Opting in replaces the server's copy in place
+        self.assertTrue(lanshare.push(self.pool, self.work_dir, replace_changed=True))
+        trash_queue.join()
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'notes_1.txt')))
+        with open(os.path.join(UPLOAD_FOLDER, 'notes.txt')) as f:
+            self.assertEqual(f.read(), 'second, longer draft')
+        self.assertTrue(lanshare.push(self.pool, self.work_dir))
+    
+    def test_push_sends_the_compared_name(self):
+        """Test that files are stored under the sanitized name push compares against"""
+        with open(os.path.join(self.work_dir, 'my "draft".txt'), 'w') as f:
+            f.write('quoted')
+        self.assertTrue(lanshare.push(self.pool, self.work_dir))
+        self.assertEqual([entry.name for entry in iter_stored_files()], ['my_draft.txt'])
+        
+        # The second push recognises the stored copy instead of uploading it again
+        self.assertTrue(lanshare.push(self.pool, self.work_dir))
+        self.assertEqual([entry.name for entry in iter_stored_files()], ['my_draft.txt'])
+    
+    def test_retried_upload_is_counted_once(self):
+        """Test that a body resent on a keep-alive retry isn't counted twice"""
+        filepath = os.path.join(self.work_dir, 'retry.txt')
+        with open(filepath, 'wb') as f:
+            f.write(b'x' * 1000)
+        
+        class RetryingPool:
+            def request(self, method, path, body=None, headers=None):
+                for attempt in range(2):
+                    b''.join(body())
+                return mock.Mock(status=302, read=lambda: b'',
+                                 getheader=lambda name, default=None: '/?success=ok')
+        
+        progress = lanshare.Progress(1000, 'test')
+        lanshare.upload(RetryingPool(), filepath, progress)
+        self.assertEqual(progress.done, 1000)
+    
+    def test_push_refuses_name_collisions(self):
+        """Test that files stored under the same name are refused, not renamed"""
+        for folder in ('a', 'b'):
+            os.makedirs(os.path.join(self.work_dir, folder))
+            with open(os.path.join(self.work_dir, folder, 'dup.txt'), 'w') as f:
+                f.write(f'from {folder}')
+        with open(os.path.join(self.work_dir, 'ok.txt'), 'w') as f:
+            f.write('no clash')
+        
+        self.assertFalse(lanshare.push(self.pool, self.work_dir))
+        self.assertEqual([entry.name for entry in iter_stored_files()], ['ok.txt'])
+    
+    def test_concurrent_same_name_uploads_are_all_kept(self):
+        """Test that concurrent uploads of one name never overwrite each other"""
+        contents = [f'upload number {i}' for i in range(8)]
+        for i, content in enumerate(contents):
+            os.makedirs(os.path.join(self.work_dir, str(i)))
+            with open(os.path.join(self.work_dir, str(i), 'same.txt'), 'w') as f:
+                f.write(content)
+        
+        progress = lanshare.Progress(0, 'test')
+        threads = [threading.Thread(target=lanshare.upload,
+                                    args=(self.pool, os.path.join(self.work_dir, str(i), 'same.txt'), progress))
+                   for i in range(len(contents))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stored = []
+        for name in os.listdir(UPLOAD_FOLDER):
+            if name.startswith('same'):
+                with open(os.path.join(UPLOAD_FOLDER, name)) as f:
+                    stored.append(f.read())
+        self.assertEqual(sorted(stored), sorted(contents))
+
+
+class TestContentValidation(SharedFilesTestCase):
+    """Test cases for checking uploaded content against its extension"""
+    
+    def upload(self, filename, data):
+        """Upload bytes under a file name and return the redirect query"""
+        response = self.client.post('/upload', data={'file': (io.BytesIO(data), filename)})
+        self.assertEqual(response.status_code, 302)
+        return parse_qs(urlparse(response.location).query)
+    
+    def test_matching_content_is_accepted(self):
+        """Test that a real PNG is saved"""
+        data = b'\x89PNG\r\n\x1a\n' + os.urandom(10000)
+        query = self.upload('image.png', data)
+        self.assertIn('success', query)
+        with open(os.path.join(UPLOAD_FOLDER, 'image.png'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+    
+    def test_renamed_file_is_rejected(self):
+        """Test that an executable renamed to .pdf is refused"""
+        query = self.upload('report.pdf', b'MZ' + b'\x00' * 10000)
+        self.assertIn('does not match', query['error'][0])
+        self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, 'report.pdf')))
+        self.assertEqual(os.listdir(INCOMING_FOLDER), [])
+    
+    def test_binary_renamed_to_txt_is_rejected(self):
+        """Test that binary data renamed to .txt is refused"""
+        query = self.upload('notes.txt', b'\x7fELF\x02\x01\x01\x00')
+        self.assertIn('error', query)
+    
+    @unittest.skipIf(os.name == 'nt', 'POSIX file modes')
+    def test_stored_file_has_default_mode(self):
+        """Test that validated uploads get the same permissions as a plain save"""
+        self.assertIn('success', self.upload('notes.txt', b'hello'))
+        reference = os.path.join(UPLOAD_FOLDER, 'reference.txt')
+        with open(reference, 'wb'):
+            pass
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(UPLOAD_FOLDER, 'notes.txt')).st_mode),
+                         stat.S_IMODE(os.stat(reference).st_mode))
+    
+    def test_rejected_second_file_removes_all_spools(self):
+        """Test that a rejected file doesn't leave earlier files spooled"""
+        response = self.client.post('/upload', data={
+            'file': (io.BytesIO(b'\x89PNG\r\n\x1a\n' + os.urandom(10000)), 'image.png'),
+            'other': (io.BytesIO(b'MZ' + b'\x00' * 10000), 'report.pdf'),
+        })
+        self.assertIn('error', parse_qs(urlparse(response.location).query))
+        self.assertEqual(os.listdir(INCOMING_FOLDER), [])
+    
+    def test_truncated_upload_removes_spool(self):
+        """Test that a body cut short mid-file leaves no spool behind"""
+        body = (b'--boundary\r\n'
+                b'Content-Disposition: form-data; name="file"; filename="notes.txt"\r\n\r\n'
+                + b'plain text ' * 1000)
+        self.client.post('/upload', input_stream=io.BytesIO(body), content_length=len(body),
+                         content_type='multipart/form-data; boundary=boundary')
+        self.assertEqual(os.listdir(INCOMING_FOLDER), [])
+    
+    def test_leftover_spools_are_swept(self):
+        """Test that spools from a previous run are removed before the first upload"""
+        os.makedirs(INCOMING_FOLDER, exist_ok=True)
+        with open(os.path.join(INCOMING_FOLDER, 'tmpleftover'), 'wb') as f:
+            f.write(b'crashed upload')
+        with mock.patch('app._incoming_swept', False):
+            self.assertIn('success', self.upload('notes.txt', b'hello'))
+        self.assertEqual(os.listdir(INCOMING_FOLDER), [])
+    
+    def test_disallowed_extension_is_rejected(self):
+        """Test that disallowed extensions are refused before any content is stored"""
+        query = self.upload('script.sh', b'#!/bin/sh')
+        self.assertEqual(query['error'][0], 'File type not allowed')
+    
+    def test_custom_validator(self):
+        """Test that validators can be plugged in per extension"""
+        saved = CONTENT_VALIDATORS['csv']
+        try:
+            content_validator('csv')(lambda head: head.startswith(b'id,'))
+            self.assertIn('error', self.upload('data.csv', b'name,age'))
+            self.assertIn('success', self.upload('data.csv', b'id,name'))
+        finally:
+            CONTENT_VALIDATORS['csv'] = saved
+
+
+class TestAsyncTransferServer(LiveServerTestCase):
+    """Test cases for the asyncio transfer server"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Start the asyncio server on a free port in a background thread"""
+        cls.loop = asyncio.new_event_loop()
+        cls.server = cls.loop.run_until_complete(AsyncTransferServer().start('127.0.0.1', 0))
+        cls.port = cls.server.sockets[0].getsockname()[1]
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the server and its event loop"""
+        cls.loop.call_soon_threadsafe(cls.server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+    
+    def multipart(self, filename, data):
+        """Build a multipart upload request split into head and body"""
+        boundary = 'testboundary'
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n\r\n'.encode()
+                + data + f'\r\n--{boundary}--\r\n'.encode())
+        head = (f'POST /upload HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+                f'Content-Type: multipart/form-data; boundary={boundary}\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n').encode()
+        return head, body
+    
+    def test_upload_and_segmented_download(self):
+        """Test a full round trip through the asyncio server"""
+        data = os.urandom(2 * lanshare.MIN_SEGMENT_SIZE + 999)
+        with open(os.path.join(self.work_dir, 'clip.mp3'), 'wb') as f:
+            f.write(b'ID3' + data)
+        self.assertTrue(lanshare.push(self.pool, self.work_dir))
+        
+        output = os.path.join(self.work_dir, 'copy.mp3')
+        lanshare.download(self.pool, 'clip.mp3', output, segments=2)
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), b'ID3' + data)
+    
+    def test_range_and_missing_file(self):
+        """Test byte ranges and redirects for missing files"""
+        with open(os.path.join(UPLOAD_FOLDER, 'range.txt'), 'wb') as f:
+            f.write(b'0123456789')
+        
+        response = self.pool.request('GET', '/download/range.txt', headers={'Range': 'bytes=2-5'})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.read(), b'2345')
+        
+        response = self.pool.request('GET', '/download/missing.txt')
+        response.read()
+        self.assertEqual(response.status, 302)
+        self.assertIn('error', response.getheader('Location'))
+    
+    def test_conditional_and_unusual_ranges(self):
+        """Test 304s, If-Range and ranges the Flask route treats the same way"""
+        with open(os.path.join(UPLOAD_FOLDER, 'range.txt'), 'wb') as f:
+            f.write(b'0123456789')
+        response = self.pool.request('GET', '/download/range.txt')
+        response.read()
+        etag = response.getheader('ETag')
+        
+        response = self.pool.request('GET', '/download/range.txt', headers={'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), b'')
+        
+        response = self.pool.request('GET', '/download/range.txt', headers={'Range': 'bytes=0-1,4-5'})
+        response.read()
+        self.assertEqual(response.status, 416)
+        
+        response = self.pool.request('GET', '/download/range.txt', headers={'Range': 'bytes=oops'})
+        self.assertEqual((response.status, response.read()), (200, b'0123456789'))
+        
+        response = self.pool.request('GET', '/download/range.txt', headers={'Range': 'bytes=2-5', 'If-Range': '"stale"'})
+        self.assertEqual((response.status, response.read()), (200, b'0123456789'))
+        
+        response = self.pool.request('GET', '/download/range.txt', headers={'Range': 'bytes=2-5', 'If-Range': etag})
+        self.assertEqual((response.status, response.read()), (206, b'2345'))
+    
+    def test_malformed_requests_get_400(self):
+        """Test that a bad request line or Content-Length is answered with 400, and chunked bodies with 411"""
+        head, body = self.multipart('notes.txt', b'hello')
+        for request in (b'NONSENSE\r\n\r\n',
+                        head.replace(f'Content-Length: {len(body)}'.encode(), b'Content-Length: ten') + body,
+                        b'POST /api/files HTTP/1.1\r\nContent-Length: -5\r\n\r\n'):
+            with socket.create_connection(('127.0.0.1', self.port)) as conn:
+                conn.sendall(request)
+                self.assertTrue(conn.recv(4096).startswith(b'HTTP/1.1 400 '))
+        
+        # A chunked body must not be read as the next request on the connection
+        chunked = (b'POST /delete HTTP/1.1\r\nTransfer-Encoding: chunked\r\n'
+                   b'Content-Type: application/x-www-form-urlencoded\r\n\r\n'
+                   b'12\r\nfilenames=keep.txt\r\n0\r\n\r\n')
+        with socket.create_connection(('127.0.0.1', self.port)) as conn:
+            conn.sendall(chunked)
+            reply = b''
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                reply += data
+        self.assertTrue(reply.startswith(b'HTTP/1.1 411 '))
+        self.assertEqual(reply.count(b'HTTP/1.1'), 1)
+    
+    def test_other_routes_go_to_flask(self):
+        """Test that the HTML page is still served by the Flask app"""
+        response = self.pool.request('GET', '/')
+        self.assertEqual(response.status, 200)
+        self.assertIn(b'LAN File Share', response.read())
+    
+    def test_mismatched_content_is_rejected(self):
+        """Test that content validation also applies to async uploads"""
+        head, body = self.multipart('fake.png', b'GIF89a' + b'\x00' * 100000)
+        with socket.create_connection(('127.0.0.1', self.port)) as conn:
+            conn.sendall(head + body[:8192])
+            reply = conn.recv(4096)
+        self.assertIn(b'302', reply.split(b'\r\n')[0])
+        self.assertIn(b'does+not+match', reply)
+    
+    def test_many_slow_clients(self):
+        """Test that slow uploads don't tie up a thread each"""
+        threads_before = threading.active_count()
+        connections = []
+        for i in range(100):
+            head, body = self.multipart(f'slow_{i}.txt', b'slow data ' * 1000)
+            conn = socket.create_connection(('127.0.0.1', self.port))
+            conn.sendall(head + body[:100])
+            connections.append((conn, body[100:]))
+        
+        # Every upload is half-sent, yet other transfers are still served
+        with open(os.path.join(UPLOAD_FOLDER, 'fast.txt'), 'wb') as f:
+            f.write(b'fast')
+        response = self.pool.request('GET', '/download/fast.txt')
+        self.assertEqual(response.read(), b'fast')
+        self.assertLess(threading.active_count() - threads_before, 20)
+        
+        for conn, rest in connections:
+            conn.sendall(rest)
+        for conn, _ in connections:
+            self.assertIn(b'success', conn.recv(4096))
+            conn.close()
+        self.assertEqual(len([name for name in os.listdir(UPLOAD_FOLDER) if name.startswith('slow_')]), 100)
+
+
 class TestAppConfiguration(unittest.TestCase):
     """Test application configuration"""
     
@@ -0,0 +1,347 @@
+"""
+LAN File Share command-line client
+Fast transfers to and from a LAN File Share server, for scripts and big files
+
+Usage:
+    python lanshare.py --server http://192.168.1.10:5000 download report.pdf -n 4
+    python lanshare.py --server http://192.168.1.10:5000 push ./photos -j 4
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, quote, parse_qs
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 256 * 1024
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024  # Smaller files are not worth splitting
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to the server, one per worker thread"""
+
+    def __init__(self, server, timeout=60):
+        parts = urlsplit(server if '://' in server else f'http://{server}')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request, reconnecting once if the server closed the connection
+
+        body may be a callable returning a fresh body, so it can be resent.
+        The caller must read the whole response before the next request.
+        """
+        for attempt in range(2):
+            conn = self.get_connection()
+            try:
+                conn.request(method, path, body=body() if callable(body) else body, headers=headers or {})
+                return conn.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self.local.conn = None
+                if attempt or not (body is None or callable(body)):
+                    raise
+
+    def close(self):
+        """Close every connection in the pool"""
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+
+
+class Progress:
+    """Aggregate throughput across all transfers, printed to stderr"""
+
+    def __init__(self, total, label):
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self.report, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.finished.set()
+        self.thread.join()
+        self.print_line()
+        sys.stderr.write('\n')
+
+    def add(self, count):
+        with self.lock:
+            self.done += count
+
+    def report(self):
+        while not self.finished.wait(0.5):
+            self.print_line()
+
+    def print_line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        percent = 100.0 * self.done / self.total if self.total else 100.0
+        sys.stderr.write(f"\r{self.label}: {format_size(self.done)} / {format_size(self.total)} "
+                         f"({percent:.0f}%) at {format_size(self.done / elapsed)}/s   ")
+        sys.stderr.flush()
+
+
+def format_size(size_bytes):
+    """Convert bytes to human-readable format"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024.0
+    return f"{size_bytes:.1f} TB"
+
+
+def fetch_segment(pool, path, output, start, end, progress):
+    """Download bytes start..end (inclusive) into the output file"""
+    headers = {'Range': f'bytes={start}-{end}'} if end >= start else {}
+    response = pool.request('GET', path, headers=headers)
+    if response.status not in (200, 206):
+        response.read()
+        raise RuntimeError(f'Server returned {response.status} for {path}')
+
+    expected = end - start + 1
+    received = 0
+    with open(output, 'r+b') as f:
+        f.seek(start)
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            received += len(chunk)
+            progress.add(len(chunk))
+
+    if received != expected:
+        raise RuntimeError(f'Segment {start}-{end} was cut short ({received} of {expected} bytes)')
+
+
+def download(pool, filename, output=None, segments=4):
+    """Download a file as parallel byte-range segments"""
+    path = f'/download/{quote(filename)}'
+    response = pool.request('HEAD', path)
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f'{filename} not found on the server')
+
+    size = int(response.getheader('Content-Length', 0))
+    if response.getheader('Accept-Ranges') != 'bytes':
+        segments = 1
+    segments = max(1, min(segments, size // MIN_SEGMENT_SIZE))
+
+    output = output or filename
+    partial = output + '.part'
+    with open(partial, 'wb') as f:
+        f.truncate(size)
+
+    # Split into equal byte ranges, the last one taking any remainder
+    step = size // segments
+    bounds = [(i * step, (i + 1) * step - 1 if i < segments - 1 else size - 1) for i in range(segments)]
+
+    with Progress(size, f'⬇️  {filename}') as progress:
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [executor.submit(fetch_segment, pool, path, partial, start, end, progress)
+                       for start, end in bounds]
+            for future in futures:
+                future.result()
+
+    os.replace(partial, output)
+    return output
+
+
+def get_remote_files(pool):
+    """Get {name: (size, mtime)} for every file on the server"""
+    response = pool.request('GET', '/api/files')
+    data = response.read()
+    if response.status != 200:
+        raise RuntimeError(f'Server returned {response.status} for /api/files')
+    return {item['name']: (item['size'], item['mtime']) for item in json.loads(data)}
+
+
+def check_redirect(response):
+    """Raise if the server's redirect carries an error message"""
+    response.read()
+    query = parse_qs(urlsplit(response.getheader('Location', '')).query)
+    if response.status != 302 or 'error' in query:
+        raise RuntimeError(query.get('error', [f'HTTP {response.status}'])[0])
+
+
+def delete(pool, name):
+    """Delete a file from the server"""
+    check_redirect(pool.request('POST', f'/delete/{quote(name)}'))
+
+
+def upload(pool, filepath, progress, name=None):
+    """Upload one file, streaming it from disk
+
+    name is the name to store it under, by default its sanitized base name.
+    """
+    boundary = uuid.uuid4().hex
+    name = name or secure_filename(os.path.basename(filepath))
+    size = os.path.getsize(filepath)
+    mtime = os.path.getmtime(filepath)
+
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="mtime"\r\n\r\n{mtime}\r\n'
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    sent = 0
+
+    def body():
+        nonlocal sent
+        # A retry resends the file from the start, so take back what was counted
+        progress.add(-sent)
+        sent = 0
+        yield head
+        with open(filepath, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sent += len(chunk)
+                progress.add(len(chunk))
+                yield chunk
+        yield tail
+
+    headers = {
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(len(head) + size + len(tail))
+    }
+    # The server answers with a redirect carrying an error or success message
+    check_redirect(pool.request('POST', '/upload', body=body, headers=headers))
+
+
+def replace(pool, filepath, progress, name):
+    """Delete the server's copy of a file, then upload the local one"""
+    delete(pool, name)
+    upload(pool, filepath, progress, name)
+
+
+def push(pool, directory, jobs=4, replace_changed=False):
+    """Upload every file under a directory that the server doesn't have yet
+
+    The server keeps a flat namespace, so files are stored by name only.
+    A file is skipped when the server has the same name with the same size
+    and modification time. If the server has the name with different
+    content, the server's copy is deleted and replaced when replace_changed
+    is set; otherwise the file is reported as changed and push fails, so
+    pushing never piles up renamed copies. Files whose names clash once
+    made safe (the same name in two subfolders, or no usable name) are
+    refused. Returns whether every file is now on the server.
+    """
+    remote = get_remote_files(pool)
+
+    local = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            local.setdefault(secure_filename(name), []).append(os.path.join(root, name))
+
+    pending = []
+    refused = []
+    changed = []
+    skipped = 0
+    for name, filepaths in sorted(local.items()):
+        if not name:
+            refused.extend((filepath, 'no usable file name') for filepath in filepaths)
+            continue
+        if len(filepaths) > 1:
+            refused.extend((filepath, f'{len(filepaths)} local files would be stored as {name}')
+                           for filepath in filepaths)
+            continue
+
+        filepath = filepaths[0]
+        local_stat = os.stat(filepath)
+        remote_stat = remote.get(name)
+        if remote_stat is None:
+            pending.append((upload, filepath, name, local_stat.st_size))
+        elif remote_stat[0] == local_stat.st_size and int(remote_stat[1]) == int(local_stat.st_mtime):
+            skipped += 1
+        elif replace_changed:
+            pending.append((replace, filepath, name, local_stat.st_size))
+        else:
+            changed.append((filepath, name))
+
+    failed = []
+    total = sum(size for _, _, _, size in pending)
+    with Progress(total, f'⬆️  {len(pending)} file(s)') as progress:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(send, pool, filepath, progress, name): filepath
+                       for send, filepath, name, _ in pending}
+            for future, filepath in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append((filepath, e))
+
+    for filepath, name in changed:
+        print(f"⚠️  {filepath}: differs from {name} on the server, not uploaded (use --replace)", file=sys.stderr)
+    for filepath, error in refused + failed:
+        print(f"❌ {filepath}: {error}", file=sys.stderr)
+    print(f"✅ Uploaded {len(pending) - len(failed)}, skipped {skipped} unchanged, "
+          f"{len(changed)} changed, {len(refused) + len(failed)} failed")
+    return not (refused or failed or changed)
+
+
+def main(argv=None):
+    """Run the command-line client"""
+    parser = argparse.ArgumentParser(prog='lanshare', description='LAN File Share command-line client')
+    parser.add_argument('--server', default=os.getenv('LANSHARE_SERVER', 'http://127.0.0.1:5000'),
+                        help='server address (default: $LANSHARE_SERVER or http://127.0.0.1:5000)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    download_parser = commands.add_parser('download', help='download a file using parallel segments')
+    download_parser.add_argument('filename')
+    download_parser.add_argument('-o', '--output', help='where to save the file (default: its name)')
+    download_parser.add_argument('-n', '--segments', type=int, default=4, help='parallel segments (default: 4)')
+
+    push_parser = commands.add_parser('push', help='upload every file in a directory')
+    push_parser.add_argument('directory')
+    push_parser.add_argument('-j', '--jobs', type=int, default=4, help='concurrent uploads (default: 4)')
+    push_parser.add_argument('--replace', action='store_true',
+                             help='replace files that differ from the copy on the server')
+
+    args = parser.parse_args(argv)
+    pool = ConnectionPool(args.server)
+    try:
+        if args.command == 'download':
+            print(f"✅ Saved {download(pool, args.filename, args.output, max(1, args.segments))}")
+            return 0
+        return 0 if push(pool, args.directory, max(1, args.jobs), args.replace) else 1
+    except (RuntimeError, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -40,6 +40,7 @@ setup(
     entry_points={
         "console_scripts": [
             "lan-file-share=app:main",
+            "lanshare=lanshare:main",
         ],
     },
     include_package_data=True,